@@ -1,7 +1,9 @@
 import duckdb
 import logging
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 import matplotlib.pyplot as plt
-import pandas as pd
 
 # Configure logging to write to analysis.log file with timestamp format
 logging.basicConfig(
@@ -11,12 +13,90 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Taxi types analyzed; each has its own transformed table and CO2 rollup
+COLORS = ['yellow', 'green']
+
+# Per-connection cache of rollup results ({con: {color: aggregates}})
+_co2_aggregates_cache = weakref.WeakKeyDictionary()
+
+def _fetch_on_cursor(con, query):
+    """Run one query on its own cursor of con and return all rows"""
+    cursor = con.cursor()
+    try:
+        return cursor.execute(query).fetchall()
+    finally:
+        cursor.close()
+
+def run_queries_concurrently(con, queries):
+    """
+    Execute independent read-only queries at the same time on separate cursors of one connection.
+    
+    Each cursor is an independent DuckDB execution context sharing the connection's buffer pool,
+    so concurrent scans overlap their I/O instead of waiting on each other.
+    
+    Args:
+        con: Active DuckDB database connection
+        queries: List of SQL query strings
+        
+    Returns:
+        list: fetchall() results, in the same order as queries
+    """
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        futures = [executor.submit(_fetch_on_cursor, con, query) for query in queries]
+        return [future.result() for future in futures]
+
+def get_co2_aggregates(con, color):
+    """
+    Read pre-aggregated CO2 totals and their extremes for every time granularity from the dbt rollup table.
+    
+    This function:
+    - Reads the small {color}_co2_rollup tables built by dbt alongside the transformed trips
+    - Derives the average CO2 per trip as total_co2 / trip_count
+    - Finds the most/least carbon heavy bucket per granularity in SQL with arg_max/arg_min
+    - Loads every color concurrently on first use and caches the results on the connection
+    
+    Args:
+        con: Active DuckDB database connection (read-only)
+        color: Taxi type ('yellow' or 'green')
+        
+    Returns:
+        dict: Maps each granularity to a dict with 'max' and 'min' (key, avg_co2) tuples and
+              'rows', a list of (key, avg_co2, total_co2, trip_count) tuples ordered by key
+    """
+    cache = _co2_aggregates_cache.setdefault(con, {})
+    if color in cache:
+        return cache[color]
+    
+    logger.info("Reading CO2 rollups for all taxi types")
+    results = run_queries_concurrently(con, [f"""
+        SELECT 
+            granularity,
+            arg_max(bucket, avg_co2) as max_bucket,
+            max(avg_co2) as max_avg_co2,
+            arg_min(bucket, avg_co2) as min_bucket,
+            min(avg_co2) as min_avg_co2,
+            list(row(bucket, avg_co2, total_co2, trip_count) ORDER BY bucket) as buckets
+        FROM (
+            SELECT granularity, bucket, total_co2 / trip_count as avg_co2, total_co2, trip_count
+            FROM {rollup_color}_co2_rollup
+        )
+        GROUP BY granularity
+    """ for rollup_color in COLORS])
+    
+    for rollup_color, rows in zip(COLORS, results):
+        cache[rollup_color] = {
+            granularity: {'max': (max_bucket, max_avg), 'min': (min_bucket, min_avg), 'rows': buckets}
+            for granularity, max_bucket, max_avg, min_bucket, min_avg, buckets in rows
+        }
+    
+    return cache[color]
+
 def largest_co2_trip_analysis(con):
     """
     Find the single largest carbon producing trip for each cab type (YELLOW and GREEN).
     
     This function:
-    - Queries both transformed tables to find maximum CO2 emissions per trip
+    - Queries both transformed tables concurrently to find maximum CO2 emissions per trip
     - Uses ORDER BY trip_co2_kgs DESC LIMIT 1 to get the top trip
     - Displays trip details including CO2 amount, distance, and datetime
     - Satisfies rubric requirement for "single largest carbon producing trip"
@@ -27,35 +107,41 @@ def largest_co2_trip_analysis(con):
     print("\n=== LARGEST CO2 PRODUCING TRIPS ===")
     logger.info("Starting largest CO2 trip analysis")
     
-    # Yellow taxi largest CO2 trip
-    yellow_max = con.execute("""
-        SELECT trip_co2_kgs, trip_distance, tpep_pickup_datetime, tpep_dropoff_datetime
+    # Yellow and green taxi largest CO2 trips, scanned concurrently on separate cursors,
+    # with display lines formatted by DuckDB's printf
+    yellow_query = """
+        SELECT 
+            trip_co2_kgs,
+            printf('YELLOW TAXI - Largest CO2 producing trip: %.3f kg CO2', trip_co2_kgs),
+            printf('  Trip distance: %.2f miles', trip_distance),
+            printf('  Pickup time: %s', tpep_pickup_datetime),
+            printf('  Dropoff time: %s', tpep_dropoff_datetime)
         FROM yellow_trips_transformed 
-        WHERE trip_co2_kgs IS NOT NULL
         ORDER BY trip_co2_kgs DESC 
         LIMIT 1
-    """).fetchone()
+    """
     
-    # Green taxi largest CO2 trip
-    green_max = con.execute("""
-        SELECT trip_co2_kgs, trip_distance, lpep_pickup_datetime, lpep_dropoff_datetime
+    green_query = """
+        SELECT 
+            trip_co2_kgs,
+            printf('GREEN TAXI - Largest CO2 producing trip: %.3f kg CO2', trip_co2_kgs),
+            printf('  Trip distance: %.2f miles', trip_distance),
+            printf('  Pickup time: %s', lpep_pickup_datetime),
+            printf('  Dropoff time: %s', lpep_dropoff_datetime)
         FROM green_trips_transformed 
-        WHERE trip_co2_kgs IS NOT NULL
         ORDER BY trip_co2_kgs DESC 
         LIMIT 1
-    """).fetchone()
+    """
     
-    print(f"YELLOW TAXI - Largest CO2 producing trip: {yellow_max[0]:.3f} kg CO2")
-    print(f"  Trip distance: {yellow_max[1]:.2f} miles")
-    print(f"  Pickup time: {yellow_max[2]}")
-    print(f"  Dropoff time: {yellow_max[3]}")
+    yellow_rows, green_rows = run_queries_concurrently(con, [yellow_query, green_query])
+    yellow_max, green_max = yellow_rows[0], green_rows[0]
     
-    print(f"\nGREEN TAXI - Largest CO2 producing trip: {green_max[0]:.3f} kg CO2")
-    print(f"  Trip distance: {green_max[1]:.2f} miles")
-    print(f"  Pickup time: {green_max[2]}")
-    print(f"  Dropoff time: {green_max[3]}")
+    # Report lines arrive pre-formatted, so they only need to be joined
+    report = "\n".join(yellow_max[1:]) + "\n\n" + "\n".join(green_max[1:])
+    print(report)
+    logger.info("\n%s", report)
     
-    logger.info(f"Yellow max CO2: {yellow_max[0]:.3f} kg, Green max CO2: {green_max[0]:.3f} kg")
+    logger.info("Yellow max CO2: %.3f kg, Green max CO2: %.3f kg", yellow_max[0], green_max[0])
 
 def co2_by_hour_analysis(con):
     """
@@ -71,38 +157,20 @@ def co2_by_hour_analysis(con):
     print("\n=== CO2 ANALYSIS BY HOUR OF DAY ===")
     logger.info("Starting CO2 by hour analysis")
     
-    # Yellow taxi by hour
-    yellow_hours = con.execute("""
-        SELECT hour_of_day, AVG(trip_co2_kgs) as avg_co2
-        FROM yellow_trips_transformed 
-        WHERE trip_co2_kgs IS NOT NULL AND hour_of_day IS NOT NULL
-        GROUP BY hour_of_day
-        ORDER BY hour_of_day
-    """).fetchall()
-    
-    # Green taxi by hour  
-    green_hours = con.execute("""
-        SELECT hour_of_day, AVG(trip_co2_kgs) as avg_co2
-        FROM green_trips_transformed 
-        WHERE trip_co2_kgs IS NOT NULL AND hour_of_day IS NOT NULL
-        GROUP BY hour_of_day
-        ORDER BY hour_of_day
-    """).fetchall()
-    
-    # Find max/min for yellow
-    yellow_max_hour = max(yellow_hours, key=lambda x: x[1])
-    yellow_min_hour = min(yellow_hours, key=lambda x: x[1])
+    # Yellow and green taxi by hour (from dbt rollups)
+    yellow_hours = get_co2_aggregates(con, 'yellow')['hour_of_day']
+    green_hours = get_co2_aggregates(con, 'green')['hour_of_day']
     
-    # Find max/min for green
-    green_max_hour = max(green_hours, key=lambda x: x[1])
-    green_min_hour = min(green_hours, key=lambda x: x[1])
+    # Max/min already computed in SQL with arg_max/arg_min
+    yellow_max_hour, yellow_min_hour = yellow_hours['max'], yellow_hours['min']
+    green_max_hour, green_min_hour = green_hours['max'], green_hours['min']
     
     print(f"YELLOW TAXI - Most carbon heavy hour: {yellow_max_hour[0]:02d}:00 ({yellow_max_hour[1]:.4f} kg CO2 avg)")
     print(f"YELLOW TAXI - Least carbon heavy hour: {yellow_min_hour[0]:02d}:00 ({yellow_min_hour[1]:.4f} kg CO2 avg)")
     print(f"GREEN TAXI - Most carbon heavy hour: {green_max_hour[0]:02d}:00 ({green_max_hour[1]:.4f} kg CO2 avg)")
     print(f"GREEN TAXI - Least carbon heavy hour: {green_min_hour[0]:02d}:00 ({green_min_hour[1]:.4f} kg CO2 avg)")
     
-    logger.info(f"Yellow peak hour: {yellow_max_hour[0]}, Green peak hour: {green_max_hour[0]}")
+    logger.info("Yellow peak hour: %s, Green peak hour: %s", yellow_max_hour[0], green_max_hour[0])
 
 def co2_by_day_analysis(con):
     """Calculate most/least carbon heavy days of week for each cab type"""
@@ -112,76 +180,40 @@ def co2_by_day_analysis(con):
     day_names = {0: 'Sunday', 1: 'Monday', 2: 'Tuesday', 3: 'Wednesday', 
                  4: 'Thursday', 5: 'Friday', 6: 'Saturday'}
     
-    # Yellow taxi by day
-    yellow_days = con.execute("""
-        SELECT day_of_week, AVG(trip_co2_kgs) as avg_co2
-        FROM yellow_trips_transformed 
-        WHERE trip_co2_kgs IS NOT NULL AND day_of_week IS NOT NULL
-        GROUP BY day_of_week
-        ORDER BY day_of_week
-    """).fetchall()
-    
-    # Green taxi by day
-    green_days = con.execute("""
-        SELECT day_of_week, AVG(trip_co2_kgs) as avg_co2
-        FROM green_trips_transformed 
-        WHERE trip_co2_kgs IS NOT NULL AND day_of_week IS NOT NULL
-        GROUP BY day_of_week
-        ORDER BY day_of_week
-    """).fetchall()
+    # Yellow and green taxi by day (from dbt rollups)
+    yellow_days = get_co2_aggregates(con, 'yellow')['day_of_week']
+    green_days = get_co2_aggregates(con, 'green')['day_of_week']
     
-    # Find max/min for yellow
-    yellow_max_day = max(yellow_days, key=lambda x: x[1])
-    yellow_min_day = min(yellow_days, key=lambda x: x[1])
-    
-    # Find max/min for green
-    green_max_day = max(green_days, key=lambda x: x[1])
-    green_min_day = min(green_days, key=lambda x: x[1])
+    # Max/min already computed in SQL with arg_max/arg_min
+    yellow_max_day, yellow_min_day = yellow_days['max'], yellow_days['min']
+    green_max_day, green_min_day = green_days['max'], green_days['min']
     
     print(f"YELLOW TAXI - Most carbon heavy day: {day_names[yellow_max_day[0]]} ({yellow_max_day[1]:.4f} kg CO2 avg)")
     print(f"YELLOW TAXI - Least carbon heavy day: {day_names[yellow_min_day[0]]} ({yellow_min_day[1]:.4f} kg CO2 avg)")
     print(f"GREEN TAXI - Most carbon heavy day: {day_names[green_max_day[0]]} ({green_max_day[1]:.4f} kg CO2 avg)")
     print(f"GREEN TAXI - Least carbon heavy day: {day_names[green_min_day[0]]} ({green_min_day[1]:.4f} kg CO2 avg)")
     
-    logger.info(f"Yellow peak day: {day_names[yellow_max_day[0]]}, Green peak day: {day_names[green_max_day[0]]}")
+    logger.info("Yellow peak day: %s, Green peak day: %s", day_names[yellow_max_day[0]], day_names[green_max_day[0]])
 
 def co2_by_week_analysis(con):
     """Calculate most/least carbon heavy weeks of year for each cab type"""
     print("\n=== CO2 ANALYSIS BY WEEK OF YEAR ===")
     logger.info("Starting CO2 by week of year analysis")
     
-    # Yellow taxi by week
-    yellow_weeks = con.execute("""
-        SELECT week_of_year, AVG(trip_co2_kgs) as avg_co2
-        FROM yellow_trips_transformed 
-        WHERE trip_co2_kgs IS NOT NULL AND week_of_year IS NOT NULL
-        GROUP BY week_of_year
-        ORDER BY week_of_year
-    """).fetchall()
-    
-    # Green taxi by week
-    green_weeks = con.execute("""
-        SELECT week_of_year, AVG(trip_co2_kgs) as avg_co2
-        FROM green_trips_transformed 
-        WHERE trip_co2_kgs IS NOT NULL AND week_of_year IS NOT NULL
-        GROUP BY week_of_year
-        ORDER BY week_of_year
-    """).fetchall()
-    
-    # Find max/min for yellow
-    yellow_max_week = max(yellow_weeks, key=lambda x: x[1])
-    yellow_min_week = min(yellow_weeks, key=lambda x: x[1])
+    # Yellow and green taxi by week (from dbt rollups)
+    yellow_weeks = get_co2_aggregates(con, 'yellow')['week_of_year']
+    green_weeks = get_co2_aggregates(con, 'green')['week_of_year']
     
-    # Find max/min for green
-    green_max_week = max(green_weeks, key=lambda x: x[1])
-    green_min_week = min(green_weeks, key=lambda x: x[1])
+    # Max/min already computed in SQL with arg_max/arg_min
+    yellow_max_week, yellow_min_week = yellow_weeks['max'], yellow_weeks['min']
+    green_max_week, green_min_week = green_weeks['max'], green_weeks['min']
     
     print(f"YELLOW TAXI - Most carbon heavy week: Week {yellow_max_week[0]} ({yellow_max_week[1]:.4f} kg CO2 avg)")
     print(f"YELLOW TAXI - Least carbon heavy week: Week {yellow_min_week[0]} ({yellow_min_week[1]:.4f} kg CO2 avg)")
     print(f"GREEN TAXI - Most carbon heavy week: Week {green_max_week[0]} ({green_max_week[1]:.4f} kg CO2 avg)")
     print(f"GREEN TAXI - Least carbon heavy week: Week {green_min_week[0]} ({green_min_week[1]:.4f} kg CO2 avg)")
     
-    logger.info(f"Yellow peak week: {yellow_max_week[0]}, Green peak week: {green_max_week[0]}")
+    logger.info("Yellow peak week: %s, Green peak week: %s", yellow_max_week[0], green_max_week[0])
 
 def co2_by_month_analysis(con):
     """Calculate most/least carbon heavy months of year for each cab type"""
@@ -191,40 +223,22 @@ def co2_by_month_analysis(con):
     month_names = {1: 'January', 2: 'February', 3: 'March', 4: 'April', 5: 'May', 6: 'June',
                    7: 'July', 8: 'August', 9: 'September', 10: 'October', 11: 'November', 12: 'December'}
     
-    # Yellow taxi by month
-    yellow_months = con.execute("""
-        SELECT month_of_year, AVG(trip_co2_kgs) as avg_co2
-        FROM yellow_trips_transformed 
-        WHERE trip_co2_kgs IS NOT NULL AND month_of_year IS NOT NULL
-        GROUP BY month_of_year
-        ORDER BY month_of_year
-    """).fetchall()
-    
-    # Green taxi by month
-    green_months = con.execute("""
-        SELECT month_of_year, AVG(trip_co2_kgs) as avg_co2
-        FROM green_trips_transformed 
-        WHERE trip_co2_kgs IS NOT NULL AND month_of_year IS NOT NULL
-        GROUP BY month_of_year
-        ORDER BY month_of_year
-    """).fetchall()
-    
-    # Find max/min for yellow
-    yellow_max_month = max(yellow_months, key=lambda x: x[1])
-    yellow_min_month = min(yellow_months, key=lambda x: x[1])
+    # Yellow and green taxi by month (from dbt rollups)
+    yellow_months = get_co2_aggregates(con, 'yellow')['month_of_year']
+    green_months = get_co2_aggregates(con, 'green')['month_of_year']
     
-    # Find max/min for green
-    green_max_month = max(green_months, key=lambda x: x[1])
-    green_min_month = min(green_months, key=lambda x: x[1])
+    # Max/min already computed in SQL with arg_max/arg_min
+    yellow_max_month, yellow_min_month = yellow_months['max'], yellow_months['min']
+    green_max_month, green_min_month = green_months['max'], green_months['min']
     
     print(f"YELLOW TAXI - Most carbon heavy month: {month_names[yellow_max_month[0]]} ({yellow_max_month[1]:.4f} kg CO2 avg)")
     print(f"YELLOW TAXI - Least carbon heavy month: {month_names[yellow_min_month[0]]} ({yellow_min_month[1]:.4f} kg CO2 avg)")
     print(f"GREEN TAXI - Most carbon heavy month: {month_names[green_max_month[0]]} ({green_max_month[1]:.4f} kg CO2 avg)")
     print(f"GREEN TAXI - Least carbon heavy month: {month_names[green_min_month[0]]} ({green_min_month[1]:.4f} kg CO2 avg)")
     
-    logger.info(f"Yellow peak month: {month_names[yellow_max_month[0]]}, Green peak month: {month_names[green_max_month[0]]}")
+    logger.info("Yellow peak month: %s, Green peak month: %s", month_names[yellow_max_month[0]], month_names[green_max_month[0]])
     
-    return yellow_months, green_months
+    return yellow_months['rows'], green_months['rows']
 
 def create_co2_plot(con):
     """
@@ -242,32 +256,33 @@ def create_co2_plot(con):
     print("\n=== GENERATING CO2 BY YEAR PLOT ===")
     logger.info("Creating CO2 by year plot")
     
-    # Get yearly CO2 totals for both taxi types
+    # Get yearly CO2 totals for both taxi types from the dbt rollups as NumPy arrays
+    # (fetchnumpy() hands over DuckDB's columnar result without pandas or Python tuples)
     yellow_yearly = con.execute("""
-        SELECT year, SUM(trip_co2_kgs) as total_co2
-        FROM yellow_trips_transformed 
-        WHERE trip_co2_kgs IS NOT NULL AND year IS NOT NULL
-        GROUP BY year
+        SELECT bucket as year, total_co2
+        FROM yellow_co2_rollup
+        WHERE granularity = 'year'
         ORDER BY year
-    """).fetchall()
+    """).fetchnumpy()
     
     green_yearly = con.execute("""
-        SELECT year, SUM(trip_co2_kgs) as total_co2
-        FROM green_trips_transformed 
-        WHERE trip_co2_kgs IS NOT NULL AND year IS NOT NULL
-        GROUP BY year
+        SELECT bucket as year, total_co2
+        FROM green_co2_rollup
+        WHERE granularity = 'year'
         ORDER BY year
-    """).fetchall()
+    """).fetchnumpy()
     
-    # Convert to pandas DataFrames for easier plotting
-    yellow_df = pd.DataFrame(yellow_yearly, columns=['year', 'total_co2'])
-    green_df = pd.DataFrame(green_yearly, columns=['year', 'total_co2'])
+    # Scale totals to million kg once, then plot and annotate from the NumPy arrays
+    yellow_years = yellow_yearly['year']
+    green_years = green_yearly['year']
+    yellow_co2_m = yellow_yearly['total_co2'] / 1000000
+    green_co2_m = green_yearly['total_co2'] / 1000000
     
     # Create the plot
     plt.figure(figsize=(12, 8))
-    plt.plot(yellow_df['year'], yellow_df['total_co2']/1000000, 'o-', 
+    plt.plot(yellow_years, yellow_co2_m, 'o-', 
              label='Yellow Taxi', linewidth=2, markersize=8, color='#FFD700')
-    plt.plot(green_df['year'], green_df['total_co2']/1000000, 's-', 
+    plt.plot(green_years, green_co2_m, 's-', 
              label='Green Taxi', linewidth=2, markersize=8, color='#32CD32')
     
     plt.xlabel('Year', fontsize=12)
@@ -275,17 +290,15 @@ def create_co2_plot(con):
     plt.title('NYC Taxi CO2 Emissions by Year (2015-2024)', fontsize=14, fontweight='bold')
     plt.legend(fontsize=11)
     plt.grid(True, alpha=0.3)
-    plt.xticks(yellow_df['year'])
+    plt.xticks(yellow_years)
     
     # Add value annotations on the points
-    for i, row in yellow_df.iterrows():
-        plt.annotate(f'{row["total_co2"]/1000000:.1f}', 
-                    (row['year'], row['total_co2']/1000000), 
+    for year, co2 in zip(yellow_years, yellow_co2_m):
+        plt.annotate(f'{co2:.1f}', (year, co2), 
                     textcoords="offset points", xytext=(0,10), ha='center', fontsize=9)
     
-    for i, row in green_df.iterrows():
-        plt.annotate(f'{row["total_co2"]/1000000:.1f}', 
-                    (row['year'], row['total_co2']/1000000), 
+    for year, co2 in zip(green_years, green_co2_m):
+        plt.annotate(f'{co2:.1f}', (year, co2), 
                     textcoords="offset points", xytext=(0,-15), ha='center', fontsize=9)
     
     plt.tight_layout()
@@ -293,39 +306,51 @@ def create_co2_plot(con):
     print("Plot saved as 'co2_emissions_by_year.png'")
     logger.info("CO2 emissions plot saved successfully")
     
-    # Print summary statistics
-    print(f"\nYellow Taxi Total CO2 (2015-2024): {yellow_df['total_co2'].sum()/1000000:.1f} million kg")
-    print(f"Green Taxi Total CO2 (2015-2024): {green_df['total_co2'].sum()/1000000:.1f} million kg")
-    print(f"Combined Total CO2 (2015-2024): {(yellow_df['total_co2'].sum() + green_df['total_co2'].sum())/1000000:.1f} million kg")
+    # Print summary statistics (each total is summed once from the yearly rollup rows)
+    yellow_total = yellow_yearly['total_co2'].sum()
+    green_total = green_yearly['total_co2'].sum()
+    print(f"\nYellow Taxi Total CO2 (2015-2024): {yellow_total/1000000:.1f} million kg")
+    print(f"Green Taxi Total CO2 (2015-2024): {green_total/1000000:.1f} million kg")
+    print(f"Combined Total CO2 (2015-2024): {(yellow_total + green_total)/1000000:.1f} million kg")
 
-def main():
+def main(con=None):
     """
     Main analysis function that orchestrates comprehensive CO2 emissions analysis.
     
     This function:
-    - Connects to DuckDB database containing transformed taxi trip data
+    - Connects to DuckDB database containing transformed taxi trip data (unless a connection is passed in)
     - Executes all required analysis functions per the project rubric
     - Provides comprehensive error handling and logging
     - Generates both text outputs and visualization plot
-    - Ensures proper database connection cleanup
+    - Ensures proper database connection cleanup for connections it opened itself
+    
+    Args:
+        con: Optional active DuckDB connection to reuse (e.g. from pipeline.py); it is left open,
+            and any error is re-raised to the caller instead of only being reported
     """
     print("=" * 60)
     print("NYC TAXI CO2 EMISSIONS ANALYSIS (2015-2024)")
     print("=" * 60)
     logger.info("Starting NYC taxi CO2 emissions analysis")
     
-    con = None
+    owns_connection = con is None
     try:
-        # Connect to database
-        con = duckdb.connect(database='emissions.duckdb', read_only=True)
-        logger.info("Connected to DuckDB database")
+        if owns_connection:
+            # Connect to database
+            con = duckdb.connect(database='emissions.duckdb', read_only=True)
+            logger.info("Connected to DuckDB database")
+            
+            # Configure DuckDB for parallel read-only aggregation
+            con.execute(f"SET threads={os.cpu_count()}")      # Use all available cores
+            con.execute("SET enable_object_cache=true")       # Reuse table metadata across queries
         
-        # Verify data availability
-        yellow_count = con.execute("SELECT COUNT(*) FROM yellow_trips_transformed WHERE trip_co2_kgs IS NOT NULL").fetchone()[0]
-        green_count = con.execute("SELECT COUNT(*) FROM green_trips_transformed WHERE trip_co2_kgs IS NOT NULL").fetchone()[0]
+        # Verify data availability from the yearly rollup rows; this also warms the rollup
+        # cache up front so every later analysis reads from memory
+        yellow_count = sum(row[3] for row in get_co2_aggregates(con, 'yellow')['year']['rows'])
+        green_count = sum(row[3] for row in get_co2_aggregates(con, 'green')['year']['rows'])
         
         print(f"Analyzing {yellow_count:,} yellow taxi trips and {green_count:,} green taxi trips")
-        logger.info(f"Processing {yellow_count:,} yellow and {green_count:,} green trips")
+        logger.info("Processing %d yellow and %d green trips", yellow_count, green_count)
         
         # Run all analyses
         largest_co2_trip_analysis(con)
@@ -342,9 +367,11 @@ def main():
         
     except Exception as e:
         print(f"Error during analysis: {e}")
-        logger.error(f"Error during analysis: {e}")
+        logger.error("Error during analysis: %s", e)
+        if not owns_connection:
+            raise  # Let the caller (e.g. pipeline.py) see the failure
     finally:
-        if con:
+        if owns_connection and con:
             con.close()
 
 if __name__ == "__main__":
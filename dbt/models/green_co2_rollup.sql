@@ -0,0 +1,31 @@
+/*
+DBT Model: Pre-aggregate green trip CO2 totals by every time granularity used in analysis.py.
+
+This model is rebuilt together with green_trips_transformed on every dbt run, so the analysis
+script reads a few hundred summary rows instead of re-scanning the full transformed table.
+All granularities are computed in a single scan using GROUPING SETS.
+
+Columns:
+- granularity: Grouping column the row belongs to (hour_of_day, day_of_week, week_of_year, month_of_year, year)
+- bucket: Value of that grouping column (e.g. hour 0-23)
+- total_co2: Sum of trip_co2_kgs for the bucket
+- trip_count: Number of trips in the bucket (average CO2 = total_co2 / trip_count)
+*/
+
+{{ config(materialized='table') }}
+
+SELECT
+    -- Tag each row with the grouping set it came from
+    CASE 0
+        WHEN GROUPING(hour_of_day) THEN 'hour_of_day'
+        WHEN GROUPING(day_of_week) THEN 'day_of_week'
+        WHEN GROUPING(week_of_year) THEN 'week_of_year'
+        WHEN GROUPING(month_of_year) THEN 'month_of_year'
+        WHEN GROUPING(year) THEN 'year'
+    END AS granularity,
+    -- Only the active grouping column is non-NULL within each grouping set (all keys are NOT NULL)
+    COALESCE(hour_of_day, day_of_week, week_of_year, month_of_year, year) AS bucket,
+    SUM(trip_co2_kgs) AS total_co2,
+    COUNT(*) AS trip_count
+FROM {{ ref('green_trips_transformed') }}
+GROUP BY GROUPING SETS ((hour_of_day), (day_of_week), (week_of_year), (month_of_year), (year))
@@ -15,7 +15,18 @@ Calculated columns added:
 - year: Year of pickup
 */
 
-{{ config(materialized='table') }}
+{# Declare the analysis columns NOT NULL so aggregations can skip NULL handling #}
+{{ config(
+    materialized='table',
+    post_hook=[
+        "ALTER TABLE {{ this }} ALTER COLUMN trip_co2_kgs SET NOT NULL",
+        "ALTER TABLE {{ this }} ALTER COLUMN hour_of_day SET NOT NULL",
+        "ALTER TABLE {{ this }} ALTER COLUMN day_of_week SET NOT NULL",
+        "ALTER TABLE {{ this }} ALTER COLUMN week_of_year SET NOT NULL",
+        "ALTER TABLE {{ this }} ALTER COLUMN month_of_year SET NOT NULL",
+        "ALTER TABLE {{ this }} ALTER COLUMN year SET NOT NULL"
+    ]
+) }}
 
 WITH trips AS (
     -- Source: cleaned green taxi trips from main schema
@@ -33,13 +44,17 @@ SELECT
     t.*,  -- Include all original columns from green_trips
     -- Calculate CO2 emissions: distance (miles) × emissions factor (g/mile) ÷ 1000 = kg
     (t.trip_distance * e.co2_grams_per_mile) / 1000.0 AS trip_co2_kgs,
-    -- Calculate average MPH: distance ÷ (duration in seconds ÷ 3600) with NULLIF to prevent division by zero
-    t.trip_distance / NULLIF(EXTRACT(EPOCH FROM (t.lpep_dropoff_datetime - t.lpep_pickup_datetime)) / 3600, 0) AS avg_mph,
+    -- Calculate average MPH: distance × 3600 ÷ duration in seconds, with NULLIF to prevent division by zero
+    t.trip_distance * 3600.0 / NULLIF(EXTRACT(EPOCH FROM (t.lpep_dropoff_datetime - t.lpep_pickup_datetime)), 0) AS avg_mph,
     -- Extract time-based features for analysis (note: uses lpep_pickup_datetime for green taxis)
-    EXTRACT(HOUR FROM t.lpep_pickup_datetime) AS hour_of_day,      -- 0-23
-    EXTRACT(DOW FROM t.lpep_pickup_datetime) AS day_of_week,       -- 0=Sunday
-    EXTRACT(WEEK FROM t.lpep_pickup_datetime) AS week_of_year,     -- 1-52
-    EXTRACT(MONTH FROM t.lpep_pickup_datetime) AS month_of_year,   -- 1-12
-    EXTRACT(YEAR FROM t.lpep_pickup_datetime) AS year             -- Full year
+    -- as 1-2 byte integers so GROUP BYs on them can use DuckDB's perfect hash aggregate
+    EXTRACT(HOUR FROM t.lpep_pickup_datetime)::TINYINT AS hour_of_day,      -- 0-23
+    EXTRACT(DOW FROM t.lpep_pickup_datetime)::TINYINT AS day_of_week,       -- 0=Sunday
+    EXTRACT(WEEK FROM t.lpep_pickup_datetime)::TINYINT AS week_of_year,     -- 1-52
+    EXTRACT(MONTH FROM t.lpep_pickup_datetime)::TINYINT AS month_of_year,   -- 1-12
+    EXTRACT(YEAR FROM t.lpep_pickup_datetime)::SMALLINT AS year             -- Full year
 FROM trips t
 CROSS JOIN emissions e  -- Cross join since emissions table has only one row for green_taxi
+-- trip_co2_kgs and every time feature are NULL exactly when these inputs are NULL
+WHERE t.trip_distance IS NOT NULL
+  AND t.lpep_pickup_datetime IS NOT NULL
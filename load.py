@@ -1,7 +1,10 @@
 import duckdb
-import time
 import logging
-import pandas as pd
+import os
+import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
+from schemas import TRIPS_DDL, TRIPS_COLUMNS, VEHICLE_EMISSIONS_COLUMNS
 
 # Configure logging to write to file with timestamp format
 logging.basicConfig(
@@ -11,172 +14,346 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def load_parquet_files():
+# NYC TLC trip record URL pattern (one parquet file per color, year and month)
+TRIP_DATA_URL = "https://d37ci6vzurychx.cloudfront.net/trip-data/{color}_tripdata_{year}-{month:02d}.parquet"
+
+# Retry policy for probes and downloads: only transient failures are retried, waiting
+# 1s, 2s, 4s, ... (capped at 30s) between attempts
+RETRY_ATTEMPTS = 5
+RETRY_INITIAL_DELAY = 1
+RETRY_MAX_DELAY = 30
+RETRYABLE_ERRORS = ('429', '503', 'timeout', 'timed out')
+RETRYABLE_STATUSES = (429, 503)
+
+# HEAD responses meaning the month is not published; any other failure is never treated as missing
+MISSING_STATUSES = (403, 404)
+
+# Local copy of each monthly file, so re-running the load does not download it again
+TRIP_DATA_PATH = "data/{color}/{year}-{month:02d}.parquet"
+
+def trip_data_files(color, years=range(2015, 2025), months=range(1, 13)):
+    """Build the (url, local path) pairs of the monthly parquet files for one taxi color (2015-2024 by default)"""
+    return [(TRIP_DATA_URL.format(color=color, year=year, month=month),
+             TRIP_DATA_PATH.format(color=color, year=year, month=month))
+            for year in years for month in months]
+
+def wait_before_retry(url, attempt, delay, error):
+    """Report a failed attempt on url, sleep for delay seconds and return the next (doubled, capped) delay"""
+    print(f"Retrying {url} in {delay}s (attempt {attempt}/{RETRY_ATTEMPTS} failed: {error})")
+    logger.warning("Retrying %s in %ds (attempt %d/%d failed: %s)", url, delay, attempt, RETRY_ATTEMPTS, error)
+    time.sleep(delay)
+    return min(delay * 2, RETRY_MAX_DELAY)
+
+def url_exists(url):
     """
-    Load yellow and green taxi parquet files from 2015-2024 into DuckDB tables.
+    Return True if url exists and False if the server reports it as not published.
+    
+    Only HTTP 403/404 mean a missing month. HTTP 429/503, timeouts and connection
+    errors are retried with the same exponential backoff as downloads; if they persist,
+    or the server answers with any other status, an error is raised instead of
+    silently dropping the month from the load.
+    
+    Args:
+        url: URL to probe with a HEAD request
+    """
+    delay = RETRY_INITIAL_DELAY
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        try:
+            status = requests.head(url, timeout=30).status_code
+        except (requests.Timeout, requests.ConnectionError) as e:
+            error = e
+        else:
+            if status == 200:
+                return True
+            if status in MISSING_STATUSES:
+                return False
+            if status not in RETRYABLE_STATUSES:
+                raise RuntimeError(f"Unexpected HTTP {status} probing {url}")
+            error = f"HTTP {status}"
+        if attempt == RETRY_ATTEMPTS:
+            raise RuntimeError(f"Could not probe {url} after {RETRY_ATTEMPTS} attempts: {error}")
+        delay = wait_before_retry(url, attempt, delay, error)
+
+def available_urls(urls):
+    """
+    Filter a list of URLs down to the ones that exist, probing them concurrently.
+    
+    A month the server does not publish would otherwise fail its download, so every
+    URL is checked with a HEAD request first (16 probes in flight at a time). A probe
+    that keeps failing for any other reason raises here rather than skipping the month.
+    
+    Args:
+        urls: List of URLs to probe
+        
+    Returns:
+        list: URLs that responded with HTTP 200, in their original order (403/404 are skipped)
+    """
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        exists = list(executor.map(url_exists, urls))
+    
+    for url, ok in zip(urls, exists):
+        if not ok:
+            print(f"✗ Skipping missing file: {url}")
+            logger.warning("Skipping missing file: %s", url)
+    
+    return [url for url, ok in zip(urls, exists) if ok]
+
+def is_retryable(error):
+    """Return True if a DuckDB IO/HTTP error looks transient (rate limit, unavailable, timeout)"""
+    message = str(error).lower()
+    return any(keyword in message for keyword in RETRYABLE_ERRORS)
+
+def download_trip_file(con, url, path):
+    """
+    Download one monthly parquet file to the local cache, recompressed with ZSTD.
     
     This function:
-    - Creates empty yellow_trips and green_trips tables with proper schema
-    - Loops through all combinations of taxi colors (yellow/green), years (2015-2024), and months (1-12)
-    - Downloads and inserts data from NYC taxi parquet files using DuckDB's read_parquet function
-    - Implements rate limiting (20 second delay) to avoid overloading the data source
-    - Handles missing files gracefully with try/catch blocks
-    - Logs all operations for debugging and monitoring
+    - Writes the file under a temporary name and renames it once complete, so an
+      interrupted download is never mistaken for a cached month on the next run
+    - Retries HTTP 429/503 responses and timeouts with exponential backoff
+      (up to RETRY_ATTEMPTS tries); any other error is raised immediately
+    - Returns as soon as the download succeeds, without sleeping
+    
+    Args:
+        con: Active DuckDB database connection (with httpfs loaded)
+        url: Remote parquet URL
+        path: Local destination path
     """
-    con = None
+    cursor = con.cursor()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        delay = RETRY_INITIAL_DELAY
+        for attempt in range(1, RETRY_ATTEMPTS + 1):
+            try:
+                # URL and destination are bound as parameters rather than spliced into the SQL
+                cursor.execute("""
+                    COPY (SELECT * FROM read_parquet($1)) 
+                    TO $2 (FORMAT PARQUET, COMPRESSION ZSTD)
+                """, [url, tmp_path])
+                break
+            except duckdb.IOException as e:
+                # duckdb.HTTPException is a subclass, so HTTP status errors land here too
+                if attempt == RETRY_ATTEMPTS or not is_retryable(e):
+                    raise
+                delay = wait_before_retry(url, attempt, delay, e)
+        os.replace(tmp_path, path)
+        logger.info("Downloaded %s to %s", url, path)
+    finally:
+        cursor.close()
+
+def load_color_trips(con, color):
+    """
+    Load every available month of one taxi color into its {color}_trips table.
     
+    This function:
+    - Downloads each month that is not already cached under data/{color}/ (16 at a time)
+    - Only probes the remote server for months missing from the local cache
+    - Fills the table from the local files, so re-runs never touch the network
+    - Runs on its own cursor so the yellow and green loads can proceed concurrently
+      from separate threads while sharing one database connection
+    
+    Args:
+        con: Active DuckDB database connection
+        color: Taxi color to load ('yellow' or 'green')
+    """
+    cursor = con.cursor()
     try:
-        # Establish connection to DuckDB database file
-        con = duckdb.connect(database='emissions.duckdb', read_only=False)
-        logger.info("Connected to DuckDB instance")
+        files = trip_data_files(color)
         
-        # Create empty tables with proper schema by reading one sample file
-        # Using WHERE 1=0 creates table structure without data
-        con.execute("""
-            CREATE OR REPLACE TABLE yellow_trips AS 
-            SELECT * FROM read_parquet('https://d37ci6vzurychx.cloudfront.net/trip-data/yellow_tripdata_2024-01.parquet')
-            WHERE 1=0  -- Create empty table with schema
-        """)
+        # Fetch the months missing from the local cache, skipping ones the server does not have
+        missing = [(url, path) for url, path in files if not os.path.exists(path)]
+        urls = set(available_urls([url for url, _ in missing]))
+        downloads = [(url, path) for url, path in missing if url in urls]
+        print(f"Downloading {len(downloads)} {color} taxi files ({len(files) - len(missing)} already cached)...")
+        logger.info("Downloading %d %s taxi files (%d already cached)", len(downloads), color, len(files) - len(missing))
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            futures = [executor.submit(download_trip_file, con, url, path) for url, path in downloads]
+            for future in futures:
+                future.result()
         
-        con.execute("""
-            CREATE OR REPLACE TABLE green_trips AS 
-            SELECT * FROM read_parquet('https://d37ci6vzurychx.cloudfront.net/trip-data/green_tripdata_2024-01.parquet')
-            WHERE 1=0  -- Create empty table with schema
-        """)
+        paths = [path for _, path in files if os.path.exists(path)]
+        if not paths:
+            # read_parquet cannot take an empty list, and an empty table would hide the problem
+            raise RuntimeError(f"No {color} trip files available (none cached under data/{color}/ or downloadable)")
+        print(f"Loading {len(paths)} {color} taxi files...")
+        logger.info("Loading %d %s taxi files", len(paths), color)
         
-        logger.info("Created empty tables with schema")
+        # Create the table from the cached DDL so no remote footer read is needed for its schema
+        cursor.execute(TRIPS_DDL[color])
+        
+        # Load every month in one statement from the local files, reading only the used columns
+        cursor.execute(f"""
+            INSERT INTO {color}_trips BY NAME 
+            SELECT {TRIPS_COLUMNS[color]} FROM read_parquet(?, union_by_name=true)
+        """, [paths])
+        
+        print(f"✓ Successfully loaded {color} trips")
+        logger.info("Successfully loaded %s trips", color)
+    finally:
+        cursor.close()
+
+def load_parquet_files(con):
+    """
+    Load yellow and green taxi parquet files from 2015-2024 into DuckDB tables.
+    
+    This function:
+    - Builds the list of monthly NYC taxi parquet URLs for each taxi color (yellow/green)
+    - Drops any missing months using concurrent HEAD probes
+    - Downloads each month once into a local ZSTD parquet cache (data/{color}/{year}-{month}.parquet)
+    - Creates each table from the DDL in schemas.py, then fills it with a single
+      read_parquet call over all of its cached files, keeping only the columns used downstream
+    - Loads both colors at the same time on separate cursors so their downloads overlap
+    - Uses union_by_name so columns are matched by name across yearly schema changes
+    - Logs all operations for debugging and monitoring
+    
+    Args:
+        con: Active DuckDB database connection
+    """
+    try:
+        # httpfs lets read_parquet fetch the remote files for the local cache
+        con.execute("INSTALL httpfs; LOAD httpfs;")
         
-        # Define parameters for data loading loop
         colors = ['yellow', 'green']    # Two taxi types
-        years = range(2015, 2025)       # 2015-2024 inclusive (10 years)
-        months = range(1, 13)           # 1-12 (12 months)
-        
-        # Calculate total files for progress tracking (2 colors × 10 years × 12 months = 240 files)
-        total_files = len(colors) * len(years) * len(months)
-        current_file = 0
-        
-        # Triple nested loop to load all taxi data files
-        for color in colors:
-            for year in years:
-                for month in months:
-                    current_file += 1
-                    # Construct URL using f-string formatting for dynamic file paths
-                    url = f"https://d37ci6vzurychx.cloudfront.net/trip-data/{color}_tripdata_{year}-{month:02d}.parquet"
-                    
-                    try:
-                        # Display progress to user
-                        print(f"Loading {current_file}/{total_files}: {color} {year}-{month:02d}")
-                        logger.info(f"Loading {url}")
-                        
-                        # Insert data directly from URL using DuckDB's read_parquet function
-                        con.execute(f"""
-                            INSERT INTO {color}_trips 
-                            SELECT * FROM read_parquet('{url}')
-                        """)
-                        
-                        print(f"✓ Successfully loaded {color} {year}-{month:02d}")
-                        logger.info(f"Successfully loaded {color} {year}-{month:02d}")
-                        
-                    except Exception as e:
-                        # Handle missing files or network errors gracefully
-                        print(f"✗ Failed to load {color} {year}-{month:02d}: {e}")
-                        logger.warning(f"Failed to load {color} {year}-{month:02d}: {e}")
-                    
-                    # Rate limiting: Sleep 20 seconds between requests to avoid overwhelming server
-                    # Skip sleep after the last file to finish faster
-                    if current_file < total_files:
-                        time.sleep(20)
+        
+        # One thread per color; result() re-raises any load failure here
+        with ThreadPoolExecutor(max_workers=len(colors)) as executor:
+            futures = [executor.submit(load_color_trips, con, color) for color in colors]
+            for future in futures:
+                future.result()
                         
     except Exception as e:
         print(f"An error occurred: {e}")
-        logger.error(f"An error occurred: {e}")
+        logger.error("An error occurred: %s", e)
         raise
-    finally:
-        # Always close database connection to prevent locks
-        if con:
-            con.close()
 
-def load_emissions_data():
+def load_emissions_data(con):
     """
     Load vehicle emissions data from local CSV file into DuckDB table.
     
     This function:
-    - Reads the vehicle_emissions.csv file using pandas
-    - Registers the dataframe as a temporary table in DuckDB
-    - Creates a permanent vehicle_emissions table from the temporary data
+    - Reads the vehicle_emissions.csv file directly with DuckDB's native CSV reader,
+      using the column types declared in schemas.py instead of inferring them
+    - Creates a permanent vehicle_emissions table in a single statement (no pandas round-trip)
     - Provides CO2 emissions factors (grams per mile) for yellow and green taxis
-    """
-    con = None
     
+    Args:
+        con: Active DuckDB database connection
+    """
     try:
-        # Connect to the same DuckDB database
-        con = duckdb.connect(database='emissions.duckdb', read_only=False)
         logger.info("Loading emissions data")
         
-        # Read CSV file into pandas DataFrame for easy data handling
-        emissions_df = pd.read_csv('data/vehicle_emissions.csv')
-        
-        # Register DataFrame as temporary table in DuckDB for SQL operations
-        con.register('emissions_temp', emissions_df)
-        
-        # Create permanent table from temporary registered DataFrame
-        con.execute("""
+        # Create permanent table straight from the CSV file
+        con.execute(f"""
             CREATE OR REPLACE TABLE vehicle_emissions AS 
-            SELECT * FROM emissions_temp
+            SELECT * FROM read_csv('data/vehicle_emissions.csv', header=true, columns={VEHICLE_EMISSIONS_COLUMNS})
         """)
         
         # Verify data loaded correctly and report count to user
         count = con.execute("SELECT COUNT(*) FROM vehicle_emissions").fetchone()[0]
         print(f"Loaded {count} vehicle emission records")
-        logger.info(f"Loaded {count} vehicle emission records")
+        logger.info("Loaded %d vehicle emission records", count)
         
     except Exception as e:
         print(f"Error loading emissions data: {e}")
-        logger.error(f"Error loading emissions data: {e}")
+        logger.error("Error loading emissions data: %s", e)
         raise
-    finally:
-        # Clean up database connection
-        if con:
-            con.close()
 
-def basic_data_summarization():
+# Trip tables summarized after loading, with their pickup datetime column
+TRIP_TABLES = {
+    'yellow_trips': 'tpep_pickup_datetime',
+    'green_trips': 'lpep_pickup_datetime',
+}
+
+def trip_table_summaries(con):
+    """
+    Return summary statistics for every trip table, reusing cached copies for unchanged tables.
+    
+    This function:
+    - Computes a cheap (row count, max rowid) signature for each table
+    - Takes the statistics stored in summary_cache for tables whose signature matches
+    - Aggregates all remaining tables in a single UNION ALL query, so DuckDB can scan
+      them in parallel, and upserts the results into summary_cache
+    
+    Args:
+        con: Active DuckDB database connection
+        
+    Returns:
+        dict: Table name -> (total_trips, earliest_trip, latest_trip, avg_distance, total_distance)
+    """
+    signatures = {
+        table: con.execute(f"SELECT COUNT(*), MAX(rowid) FROM {table}").fetchone()
+        for table in TRIP_TABLES
+    }
+    
+    # Reuse the stored statistics of tables that still have the same signature
+    summaries = {}
+    for table, (row_count, max_rowid) in signatures.items():
+        cached = con.execute("""
+            SELECT total_trips, earliest_trip, latest_trip, avg_distance, total_distance
+            FROM summary_cache
+            WHERE table_name = ? AND row_count = ? AND max_rowid IS NOT DISTINCT FROM ?
+        """, [table, row_count, max_rowid]).fetchone()
+        if cached:
+            logger.info("Using cached summary for %s", table)
+            summaries[table] = cached
+    
+    stale = [table for table in TRIP_TABLES if table not in summaries]
+    if stale:
+        # Aggregate every changed table in one query, tagging each row with its table name
+        query = " UNION ALL ".join(f"""
+            SELECT 
+                '{table}' as table_name,
+                COUNT(*) as total_trips,
+                MIN({TRIP_TABLES[table]}) as earliest_trip,
+                MAX({TRIP_TABLES[table]}) as latest_trip,
+                AVG(trip_distance) as avg_distance,
+                SUM(trip_distance) as total_distance
+            FROM {table}
+        """ for table in stale)
+        for table, *stats in con.execute(query).fetchall():
+            con.execute("INSERT OR REPLACE INTO summary_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [table, *signatures[table], *stats])
+            logger.info("Cached summary for %s", table)
+            summaries[table] = tuple(stats)
+    
+    return summaries
+
+def basic_data_summarization(con):
     """
     Generate and display basic summary statistics for all loaded data.
     
     This function:
-    - Connects to DuckDB in read-only mode for data analysis
-    - Calculates key metrics (count, date ranges, distances) for both taxi types
+    - Maintains the summary_cache table (the connection must be writable)
+    - Calculates key metrics (count, date ranges, distances) for both taxi types,
+      skipping the full-table scan for any table unchanged since the last run
     - Formats and displays comprehensive summary statistics to console and log
     - Provides verification that data loading completed successfully
-    """
-    con = None
     
+    Args:
+        con: Active DuckDB database connection
+    """
     try:
-        # Connect in read-only mode since we're only querying data
-        con = duckdb.connect(database='emissions.duckdb', read_only=False)
         logger.info("Generating data summary")
         
-        # Query yellow taxi summary statistics using aggregate functions
-        yellow_stats = con.execute("""
-            SELECT 
-                COUNT(*) as total_trips,
-                MIN(tpep_pickup_datetime) as earliest_trip,
-                MAX(tpep_pickup_datetime) as latest_trip,
-                AVG(trip_distance) as avg_distance,
-                SUM(trip_distance) as total_distance
-            FROM yellow_trips
-        """).fetchone()
+        # Summary statistics keyed by each table's (row count, max rowid) signature
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS summary_cache (
+                table_name VARCHAR PRIMARY KEY,
+                row_count BIGINT,
+                max_rowid BIGINT,
+                total_trips BIGINT,
+                earliest_trip TIMESTAMP,
+                latest_trip TIMESTAMP,
+                avg_distance DOUBLE,
+                total_distance DOUBLE
+            )
+        """)
         
-        # Query green taxi summary statistics (note different datetime column names)
-        green_stats = con.execute("""
-            SELECT 
-                COUNT(*) as total_trips,
-                MIN(lpep_pickup_datetime) as earliest_trip,
-                MAX(lpep_pickup_datetime) as latest_trip,
-                AVG(trip_distance) as avg_distance,
-                SUM(trip_distance) as total_distance
-            FROM green_trips
-        """).fetchone()
+        # Yellow and green summaries, computed together (or read from the cache)
+        summaries = trip_table_summaries(con)
+        yellow_stats = summaries['yellow_trips']
+        green_stats = summaries['green_trips']
         
         # Get count of emissions lookup records
         emissions_count = con.execute("SELECT COUNT(*) FROM vehicle_emissions").fetchone()[0]
@@ -200,42 +377,49 @@ Total Combined Trips: {yellow_stats[0] + green_stats[0]:,}
         
         # Output summary to both console and log file
         print(summary)
-        logger.info(summary)
+        logger.info("%s", summary)
         
     except Exception as e:
         print(f"Error generating summary: {e}")
-        logger.error(f"Error generating summary: {e}")
+        logger.error("Error generating summary: %s", e)
         raise
-    finally:
-        # Ensure database connection is properly closed
-        if con:
-            con.close()
 
 if __name__ == "__main__":
     """
     Main execution block that orchestrates the entire data loading process.
     
-    Executes three key functions in sequence:
+    Executes three key functions in sequence on one shared connection:
     1. load_parquet_files() - Downloads and loads 240 taxi data files
     2. load_emissions_data() - Loads vehicle emissions lookup table  
     3. basic_data_summarization() - Generates summary statistics
     
     Includes comprehensive error handling and logging for the entire process.
     """
+    con = None
+    
     try:
         logger.info("STARTING DATA LOADING PROCESS")
         print("Starting NYC Taxi Data Loading Process (2015-2024)")
         
+        # Open the database once and share the connection across all three steps
+        con = duckdb.connect(database='emissions.duckdb', read_only=False)
+        con.execute("PRAGMA enable_object_cache")  # Reuse parquet metadata across the reads below
+        logger.info("Connected to DuckDB instance")
+        
         # Execute the three main loading functions in sequence
-        load_parquet_files()      # Load taxi trip data (240 files)
-        load_emissions_data()     # Load emissions lookup table
-        basic_data_summarization() # Generate summary statistics
+        load_parquet_files(con)      # Load taxi trip data (240 files)
+        load_emissions_data(con)     # Load emissions lookup table
+        basic_data_summarization(con) # Generate summary statistics
         
         logger.info("DATA LOADING PROCESS COMPLETED")
         print("\nLOADING PROCESS COMPLETED")
         
     except Exception as e:
         # Log fatal errors and exit with error code
-        logger.error(f"Fatal error in main execution: {e}")
+        logger.error("Fatal error in main execution: %s", e)
         print(f"Fatal error: {e}")
-        exit(1)
\ No newline at end of file
+        exit(1)
+    finally:
+        # Close the shared connection once, after every step has run
+        if con:
+            con.close()
\ No newline at end of file
@@ -0,0 +1,87 @@
+import duckdb
+import logging
+import os
+import subprocess
+
+# Configure logging to write to pipeline.log file with timestamp format
+# (before importing clean/analysis so their basicConfig calls become no-ops)
+logging.basicConfig(
+    level=logging.INFO, 
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    filename='pipeline.log'
+)
+
+import analysis
+import clean
+
+logger = logging.getLogger(__name__)
+
+def configure_connection(con):
+    """Apply the DuckDB settings shared by every phase of the pipeline"""
+    con.execute(f"SET threads={os.cpu_count()}")      # Use all available cores
+    con.execute("SET preserve_insertion_order=false")  # Let cleaned tables be written in any order
+    con.execute("PRAGMA enable_object_cache")          # Cache table metadata across phases
+
+def run_dbt():
+    """
+    Rebuild the dbt models (transformed trips and CO2 rollups) from the cleaned tables.
+    
+    Runs from the dbt/ directory because profiles.yml points at ../emissions.duckdb.
+    Raises CalledProcessError if dbt fails, so analysis never runs on missing models.
+    """
+    print("Rebuilding dbt models...")
+    logger.info("Running dbt to rebuild transformed trips and CO2 rollups")
+    subprocess.run(['dbt', 'run', '--profiles-dir', '.'], cwd='dbt', check=True)
+    logger.info("dbt run completed")
+
+def run_pipeline():
+    """
+    Run cleaning, cleaning verification, the dbt models and analysis in one go.
+    
+    This function:
+    - Cleans yellow and green trips and verifies the cleaning conditions (clean.py)
+    - Drops the CO2 rollups built from the previous data, as clean.py does, and rebuilds
+      every dbt model from the freshly cleaned tables (the raw tables may have been
+      reloaded since the models were last built, so the old rollups cannot be reused)
+    - Runs the full CO2 analysis and plot (analysis.py)
+    - Raises if cleaning verification, dbt or the analysis fails
+    
+    The connection is closed while dbt runs, because dbt opens emissions.duckdb itself
+    and DuckDB allows only one process to write to the file. Expects load.py to have
+    loaded the raw tables.
+    """
+    con = None
+    
+    try:
+        con = duckdb.connect(database='emissions.duckdb', read_only=False)
+        logger.info("STARTING PIPELINE")
+        print("Starting clean -> verify -> dbt -> analysis pipeline...")
+        configure_connection(con)
+        
+        clean.clean_yellow_trips(con)
+        clean.clean_green_trips(con)
+        clean.invalidate_rollups(con)  # Drop CO2 rollups built from the previous data
+        if not clean.verify_cleaning(con):
+            raise RuntimeError("Cleaning verification failed")
+        
+        # Release the database file so dbt can write to it
+        con.close()
+        con = None
+        run_dbt()
+        
+        con = duckdb.connect(database='emissions.duckdb', read_only=False)
+        configure_connection(con)
+        analysis.main(con)  # Re-raises analysis errors since the connection is passed in
+        
+        logger.info("PIPELINE COMPLETED")
+        
+    except Exception as e:
+        print(f"Error during pipeline: {e}")
+        logger.error("Error during pipeline: %s", e)
+        raise
+    finally:
+        if con:
+            con.close()
+
+if __name__ == "__main__":
+    run_pipeline()
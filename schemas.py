@@ -0,0 +1,55 @@
+# Table definitions for the raw NYC TLC trip tables.
+# Types dumped from DESCRIBE on tables loaded with read_parquet(..., union_by_name=true)
+# over 2015-2024, so the schema no longer has to be fetched from CloudFront before loading.
+
+# Columns loaded from the parquet files: the trip key plus everything the dbt models and analysis read.
+# The other ~12 TLC columns are never used, so they are dropped at ingest.
+# Timestamps come first, followed by the low-cardinality numeric columns that compress well.
+YELLOW_TRIP_COLUMNS = "tpep_pickup_datetime, tpep_dropoff_datetime, VendorID, passenger_count, trip_distance, fare_amount, total_amount"
+GREEN_TRIP_COLUMNS = "lpep_pickup_datetime, lpep_dropoff_datetime, VendorID, passenger_count, trip_distance, fare_amount, total_amount"
+
+# Yellow taxi trips (tpep_* datetime columns)
+YELLOW_TRIPS_DDL = """
+    CREATE OR REPLACE TABLE yellow_trips (
+        tpep_pickup_datetime TIMESTAMP,
+        tpep_dropoff_datetime TIMESTAMP,
+        VendorID BIGINT,
+        passenger_count DOUBLE,
+        trip_distance DOUBLE,
+        fare_amount DOUBLE,
+        total_amount DOUBLE
+    )
+"""
+
+# Green taxi trips (lpep_* datetime columns)
+GREEN_TRIPS_DDL = """
+    CREATE OR REPLACE TABLE green_trips (
+        lpep_pickup_datetime TIMESTAMP,
+        lpep_dropoff_datetime TIMESTAMP,
+        VendorID BIGINT,
+        passenger_count DOUBLE,
+        trip_distance DOUBLE,
+        fare_amount DOUBLE,
+        total_amount DOUBLE
+    )
+"""
+
+# Lookups used by load.py to create and fill each color's table
+TRIPS_DDL = {
+    'yellow': YELLOW_TRIPS_DDL,
+    'green': GREEN_TRIPS_DDL,
+}
+TRIPS_COLUMNS = {
+    'yellow': YELLOW_TRIP_COLUMNS,
+    'green': GREEN_TRIP_COLUMNS,
+}
+
+# Column types of data/vehicle_emissions.csv, passed to read_csv so no type sniffing is needed
+VEHICLE_EMISSIONS_COLUMNS = """{
+    'vehicle_type': 'VARCHAR',
+    'fuel_type': 'VARCHAR',
+    'mpg_city': 'BIGINT',
+    'mpg_highway': 'BIGINT',
+    'co2_grams_per_mile': 'BIGINT',
+    'vehicle_year_avg': 'BIGINT'
+}"""
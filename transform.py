@@ -1,5 +1,7 @@
 import duckdb
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 # I am doing the transformation in DBT
 # Configure logging to write to transform.log file with timestamp format
 logging.basicConfig(
@@ -9,16 +11,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Derived columns computed by the views; excluded from the source scan so a
+# database transformed by the older in-place UPDATE still yields unique names
+DERIVED_COLUMNS = "'trip_co2_kgs', 'avg_mph', 'hour_of_day', 'day_of_week', 'week_of_year', 'month_of_year'"
+
+def create_dim_date(con):
+    """
+    Create the dim_date calendar table used by the enriched trip views.
+    
+    Cleaned trips all fall between 2015 and 2024, so their pickup dates take at most
+    3,653 distinct values. Decomposing each date once here and hash-joining on it
+    replaces three EXTRACT calls per trip with a lookup in a tiny, cached table.
+    
+    Args:
+        con: Active DuckDB database connection
+    """
+    con.execute("""
+        CREATE OR REPLACE TABLE dim_date AS
+        SELECT 
+            d::DATE AS pickup_date,
+            EXTRACT(DOW FROM d)::TINYINT AS day_of_week,      -- Day of week (0=Sunday)
+            EXTRACT(WEEK FROM d)::TINYINT AS week_of_year,    -- Week number (1-53)
+            EXTRACT(MONTH FROM d)::TINYINT AS month_of_year   -- Month (1-12)
+        FROM range(DATE '2015-01-01', DATE '2025-01-01', INTERVAL 1 DAY) t(d)
+    """)
+    
+    count = con.execute("SELECT COUNT(*) FROM dim_date").fetchone()[0]
+    print(f"Created dim_date with {count:,} days")
+    logger.info("Created dim_date with %d days", count)
+
 def transform_yellow_trips(con):
     """
-    Add calculated columns to yellow trips table using batched UPDATE operations.
+    Expose yellow trips with calculated columns through the yellow_trips_enriched view.
     
     This function:
-    - Adds 6 new columns: trip_co2_kgs, avg_mph, hour_of_day, day_of_week, week_of_year, month_of_year
-    - Uses batched processing (1M rows per batch) to handle large dataset efficiently
-    - Calculates CO2 emissions by joining with vehicle_emissions table
-    - Extracts time-based features from pickup datetime
-    - Processes 731M+ rows in manageable chunks to avoid memory issues
+    - Defines 6 derived columns: trip_co2_kgs, avg_mph, hour_of_day, day_of_week, week_of_year, month_of_year
+    - Uses a VIEW so nothing is written: the derived columns are cheap functions of existing
+      columns and DuckDB recomputes them faster than it could read stored copies from disk
+    - Calculates CO2 emissions by joining with vehicle_emissions table (one row, broadcast to every trip)
+    - Extracts the pickup hour directly and looks up day of week, week and month in dim_date
+    - Leaves the cleaned yellow_trips table untouched
     
     Args:
         con: Active DuckDB database connection
@@ -26,66 +58,37 @@ def transform_yellow_trips(con):
     logger.info("Starting yellow trips transformations")
     print("Transforming yellow trips data...")
     
-    # Add calculated columns individually (DuckDB doesn't support multiple ADD COLUMN in one statement)
-    con.execute("ALTER TABLE yellow_trips ADD COLUMN IF NOT EXISTS trip_co2_kgs DOUBLE")    # CO2 emissions in kilograms
-    con.execute("ALTER TABLE yellow_trips ADD COLUMN IF NOT EXISTS avg_mph DOUBLE")         # Average speed in miles per hour
-    con.execute("ALTER TABLE yellow_trips ADD COLUMN IF NOT EXISTS hour_of_day INTEGER")   # Hour of pickup (0-23)
-    con.execute("ALTER TABLE yellow_trips ADD COLUMN IF NOT EXISTS day_of_week INTEGER")   # Day of week (0=Sunday)
-    con.execute("ALTER TABLE yellow_trips ADD COLUMN IF NOT EXISTS week_of_year INTEGER")  # Week number (1-52)
-    con.execute("ALTER TABLE yellow_trips ADD COLUMN IF NOT EXISTS month_of_year INTEGER") # Month number (1-12)
-    
-    # Process updates in batches to avoid memory exhaustion with large datasets
-    print("Updating yellow trips in batches...")
-    logger.info("Starting batched update of yellow trips")
-    
-    # Get total row count to calculate number of batches needed
-    total_rows = con.execute("SELECT COUNT(*) FROM yellow_trips").fetchone()[0]
-    batch_size = 1000000  # Process 1M rows per batch for memory efficiency
-    batches = (total_rows + batch_size - 1) // batch_size  # Calculate total batches (round up)
-    
-    print(f"Processing {total_rows:,} rows in {batches} batches of {batch_size:,} rows each...")
-    
-    # Process each batch individually to maintain memory constraints
-    for i in range(batches):
-        offset = i * batch_size  # Calculate starting row for this batch
-        print(f"Processing batch {i+1}/{batches} (rows {offset:,} to {offset + batch_size - 1:,})")
-        logger.info(f"Processing batch {i+1}/{batches}")
-        
-        # Update batch using rowid-based filtering for precise row targeting
-        con.execute(f"""
-            UPDATE yellow_trips 
-            SET 
-                trip_co2_kgs = (trip_distance * ve.co2_grams_per_mile) / 1000.0,      -- Convert grams to kg
-                avg_mph = trip_distance / (EXTRACT(EPOCH FROM (tpep_dropoff_datetime - tpep_pickup_datetime)) / 3600.0),  -- Miles per hour
-                hour_of_day = EXTRACT(HOUR FROM tpep_pickup_datetime),               -- Hour (0-23)
-                day_of_week = EXTRACT(DOW FROM tpep_pickup_datetime),                -- Day of week (0=Sunday)
-                week_of_year = EXTRACT(WEEK FROM tpep_pickup_datetime),              -- Week number (1-52)
-                month_of_year = EXTRACT(MONTH FROM tpep_pickup_datetime)             -- Month (1-12)
-            FROM vehicle_emissions ve
-            WHERE ve.vehicle_type = 'yellow_taxi'
-            AND yellow_trips.rowid IN (
-                SELECT rowid FROM yellow_trips 
-                ORDER BY rowid 
-                LIMIT {batch_size} OFFSET {offset}
-            )
-        """)
-        
-    print("Yellow trips batch processing completed!")
+    # Define the enriched view over the cleaned table; consumers that need a physical
+    # copy can materialize it themselves with CREATE TABLE AS SELECT
+    con.execute(f"""
+        CREATE OR REPLACE VIEW yellow_trips_enriched AS
+        SELECT 
+            yt.*,
+            (yt.trip_distance * ve.co2_grams_per_mile) / 1000.0 AS trip_co2_kgs,              -- Convert grams to kg
+            yt.trip_distance * 3600.0 / NULLIF(EXTRACT(EPOCH FROM (yt.tpep_dropoff_datetime - yt.tpep_pickup_datetime)), 0) AS avg_mph,  -- Miles per hour, NULL for zero-duration trips
+            EXTRACT(HOUR FROM yt.tpep_pickup_datetime)::TINYINT AS hour_of_day,               -- Hour (0-23)
+            dd.day_of_week,                                                                   -- Day of week (0=Sunday)
+            dd.week_of_year,                                                                  -- Week number (1-53)
+            dd.month_of_year                                                                  -- Month (1-12)
+        FROM (SELECT COLUMNS(c -> c NOT IN ({DERIVED_COLUMNS})) FROM yellow_trips) yt
+        JOIN vehicle_emissions ve ON ve.vehicle_type = 'yellow_taxi'
+        LEFT JOIN dim_date dd ON dd.pickup_date = yt.tpep_pickup_datetime::DATE           -- Calendar parts looked up per day
+    """)
     
     # Get count of transformed rows
-    count = con.execute("SELECT COUNT(*) FROM yellow_trips WHERE trip_co2_kgs IS NOT NULL").fetchone()[0]
+    count = con.execute("SELECT COUNT(*) FROM yellow_trips_enriched WHERE trip_co2_kgs IS NOT NULL").fetchone()[0]
     print(f"Yellow trips transformed: {count:,} rows")
-    logger.info(f"Yellow trips transformed: {count:,} rows")
+    logger.info("Yellow trips transformed: %d rows", count)
 
 def transform_green_trips(con):
     """
-    Add calculated columns to green trips table using batched UPDATE operations.
+    Expose green trips with calculated columns through the green_trips_enriched view.
     
     This function mirrors transform_yellow_trips but processes green taxi data:
-    - Adds the same 6 calculated columns as yellow trips
+    - Defines the same 6 calculated columns as yellow trips
     - Uses lpep_* datetime columns instead of tpep_* columns
-    - Applies the same batched processing approach for memory efficiency
-    - Joins with vehicle_emissions using 'green_taxi' vehicle type
+    - Creates a VIEW, so the cleaned green_trips table is never rewritten
+    - Joins with vehicle_emissions using 'green_taxi' vehicle type and with dim_date
     
     Args:
         con: Active DuckDB database connection
@@ -93,81 +96,44 @@ def transform_green_trips(con):
     logger.info("Starting green trips transformations")
     print("Transforming green trips data...")
     
-    # Add calculated columns (one at a time due to DuckDB limitation)
-    con.execute("ALTER TABLE green_trips ADD COLUMN IF NOT EXISTS trip_co2_kgs DOUBLE")
-    con.execute("ALTER TABLE green_trips ADD COLUMN IF NOT EXISTS avg_mph DOUBLE")
-    con.execute("ALTER TABLE green_trips ADD COLUMN IF NOT EXISTS hour_of_day INTEGER")
-    con.execute("ALTER TABLE green_trips ADD COLUMN IF NOT EXISTS day_of_week INTEGER")
-    con.execute("ALTER TABLE green_trips ADD COLUMN IF NOT EXISTS week_of_year INTEGER")
-    con.execute("ALTER TABLE green_trips ADD COLUMN IF NOT EXISTS month_of_year INTEGER")
-    
-    # Update in batches to avoid memory issues
-    print("Updating green trips in batches...")
-    logger.info("Starting batched update of green trips")
-    
-    # Get total count for progress tracking
-    total_rows = con.execute("SELECT COUNT(*) FROM green_trips").fetchone()[0]
-    batch_size = 1000000  # 1M rows per batch
-    batches = (total_rows + batch_size - 1) // batch_size
-    
-    print(f"Processing {total_rows:,} rows in {batches} batches of {batch_size:,} rows each...")
-    
-    for i in range(batches):
-        offset = i * batch_size
-        print(f"Processing batch {i+1}/{batches} (rows {offset:,} to {offset + batch_size - 1:,})")
-        logger.info(f"Processing batch {i+1}/{batches}")
-        
-        con.execute(f"""
-            UPDATE green_trips 
-            SET 
-                trip_co2_kgs = (trip_distance * ve.co2_grams_per_mile) / 1000.0,
-                avg_mph = trip_distance / (EXTRACT(EPOCH FROM (lpep_dropoff_datetime - lpep_pickup_datetime)) / 3600.0),
-                hour_of_day = EXTRACT(HOUR FROM lpep_pickup_datetime),
-                day_of_week = EXTRACT(DOW FROM lpep_pickup_datetime),
-                week_of_year = EXTRACT(WEEK FROM lpep_pickup_datetime),
-                month_of_year = EXTRACT(MONTH FROM lpep_pickup_datetime)
-            FROM vehicle_emissions ve
-            WHERE ve.vehicle_type = 'green_taxi'
-            AND green_trips.rowid IN (
-                SELECT rowid FROM green_trips 
-                ORDER BY rowid 
-                LIMIT {batch_size} OFFSET {offset}
-            )
-        """)
-        
-    print("Green trips batch processing completed!")
+    # Define the enriched view over the cleaned table
+    con.execute(f"""
+        CREATE OR REPLACE VIEW green_trips_enriched AS
+        SELECT 
+            gt.*,
+            (gt.trip_distance * ve.co2_grams_per_mile) / 1000.0 AS trip_co2_kgs,
+            gt.trip_distance * 3600.0 / NULLIF(EXTRACT(EPOCH FROM (gt.lpep_dropoff_datetime - gt.lpep_pickup_datetime)), 0) AS avg_mph,
+            EXTRACT(HOUR FROM gt.lpep_pickup_datetime)::TINYINT AS hour_of_day,
+            dd.day_of_week,
+            dd.week_of_year,
+            dd.month_of_year
+        FROM (SELECT COLUMNS(c -> c NOT IN ({DERIVED_COLUMNS})) FROM green_trips) gt
+        JOIN vehicle_emissions ve ON ve.vehicle_type = 'green_taxi'
+        LEFT JOIN dim_date dd ON dd.pickup_date = gt.lpep_pickup_datetime::DATE
+    """)
     
     # Get count of transformed rows
-    count = con.execute("SELECT COUNT(*) FROM green_trips WHERE trip_co2_kgs IS NOT NULL").fetchone()[0]
+    count = con.execute("SELECT COUNT(*) FROM green_trips_enriched WHERE trip_co2_kgs IS NOT NULL").fetchone()[0]
     print(f"Green trips transformed: {count:,} rows")
-    logger.info(f"Green trips transformed: {count:,} rows")
+    logger.info("Green trips transformed: %d rows", count)
 
 def verify_transformations(con):
-    """Verify that all transformations have been applied correctly"""
+    """Verify that all transformations have been applied correctly (one scan per table)"""
     logger.info("Starting transformation verification")
     print("\n=== TRANSFORMATION VERIFICATION ===")
     
     # Check yellow trips
     print("\nYellow Trips Verification:")
     
-    # Check for NULL values in new columns
-    null_co2 = con.execute("SELECT COUNT(*) FROM yellow_trips WHERE trip_co2_kgs IS NULL").fetchone()[0]
-    null_mph = con.execute("SELECT COUNT(*) FROM yellow_trips WHERE avg_mph IS NULL").fetchone()[0]
-    null_hour = con.execute("SELECT COUNT(*) FROM yellow_trips WHERE hour_of_day IS NULL").fetchone()[0]
-    null_dow = con.execute("SELECT COUNT(*) FROM yellow_trips WHERE day_of_week IS NULL").fetchone()[0]
-    null_week = con.execute("SELECT COUNT(*) FROM yellow_trips WHERE week_of_year IS NULL").fetchone()[0]
-    null_month = con.execute("SELECT COUNT(*) FROM yellow_trips WHERE month_of_year IS NULL").fetchone()[0]
-    
-    print(f"Trips with NULL trip_co2_kgs: {null_co2}")
-    print(f"Trips with NULL avg_mph: {null_mph}")
-    print(f"Trips with NULL hour_of_day: {null_hour}")
-    print(f"Trips with NULL day_of_week: {null_dow}")
-    print(f"Trips with NULL week_of_year: {null_week}")
-    print(f"Trips with NULL month_of_year: {null_month}")
-    
-    # Sample statistics
-    stats = con.execute("""
+    # Count NULLs in every new column and gather sample statistics in a single scan
+    row = con.execute("""
         SELECT 
+            COUNT(*) FILTER (WHERE trip_co2_kgs IS NULL) as null_co2,
+            COUNT(*) FILTER (WHERE avg_mph IS NULL) as null_mph,
+            COUNT(*) FILTER (WHERE hour_of_day IS NULL) as null_hour,
+            COUNT(*) FILTER (WHERE day_of_week IS NULL) as null_dow,
+            COUNT(*) FILTER (WHERE week_of_year IS NULL) as null_week,
+            COUNT(*) FILTER (WHERE month_of_year IS NULL) as null_month,
             AVG(trip_co2_kgs) as avg_co2,
             AVG(avg_mph) as avg_speed,
             MIN(hour_of_day) as min_hour,
@@ -178,8 +144,17 @@ def verify_transformations(con):
             MAX(week_of_year) as max_week,
             MIN(month_of_year) as min_month,
             MAX(month_of_year) as max_month
-        FROM yellow_trips
+        FROM yellow_trips_enriched
     """).fetchone()
+    null_co2, null_mph, null_hour, null_dow, null_week, null_month = row[:6]
+    stats = row[6:]
+    
+    print(f"Trips with NULL trip_co2_kgs: {null_co2}")
+    print(f"Trips with NULL avg_mph: {null_mph}")
+    print(f"Trips with NULL hour_of_day: {null_hour}")
+    print(f"Trips with NULL day_of_week: {null_dow}")
+    print(f"Trips with NULL week_of_year: {null_week}")
+    print(f"Trips with NULL month_of_year: {null_month}")
     
     print(f"Average CO2 per trip: {stats[0]:.3f} kg")
     print(f"Average speed: {stats[1]:.1f} mph")
@@ -188,30 +163,22 @@ def verify_transformations(con):
     print(f"Week range: {stats[6]} to {stats[7]}")
     print(f"Month range: {stats[8]} to {stats[9]}")
     
-    logger.info(f"Yellow trips - NULL counts: CO2={null_co2}, MPH={null_mph}, Hour={null_hour}, DOW={null_dow}, Week={null_week}, Month={null_month}")
-    logger.info(f"Yellow trips - Avg CO2: {stats[0]:.3f}, Avg Speed: {stats[1]:.1f}")
+    logger.info("Yellow trips - NULL counts: CO2=%d, MPH=%d, Hour=%d, DOW=%d, Week=%d, Month=%d",
+                null_co2, null_mph, null_hour, null_dow, null_week, null_month)
+    logger.info("Yellow trips - Avg CO2: %.3f, Avg Speed: %.1f", stats[0], stats[1])
     
     # Check green trips
     print("\nGreen Trips Verification:")
     
-    # Check for NULL values in new columns
-    null_co2_g = con.execute("SELECT COUNT(*) FROM green_trips WHERE trip_co2_kgs IS NULL").fetchone()[0]
-    null_mph_g = con.execute("SELECT COUNT(*) FROM green_trips WHERE avg_mph IS NULL").fetchone()[0]
-    null_hour_g = con.execute("SELECT COUNT(*) FROM green_trips WHERE hour_of_day IS NULL").fetchone()[0]
-    null_dow_g = con.execute("SELECT COUNT(*) FROM green_trips WHERE day_of_week IS NULL").fetchone()[0]
-    null_week_g = con.execute("SELECT COUNT(*) FROM green_trips WHERE week_of_year IS NULL").fetchone()[0]
-    null_month_g = con.execute("SELECT COUNT(*) FROM green_trips WHERE month_of_year IS NULL").fetchone()[0]
-    
-    print(f"Trips with NULL trip_co2_kgs: {null_co2_g}")
-    print(f"Trips with NULL avg_mph: {null_mph_g}")
-    print(f"Trips with NULL hour_of_day: {null_hour_g}")
-    print(f"Trips with NULL day_of_week: {null_dow_g}")
-    print(f"Trips with NULL week_of_year: {null_week_g}")
-    print(f"Trips with NULL month_of_year: {null_month_g}")
-    
-    # Sample statistics
-    stats_g = con.execute("""
+    # NULL counts and sample statistics in one scan, as for yellow trips
+    row_g = con.execute("""
         SELECT 
+            COUNT(*) FILTER (WHERE trip_co2_kgs IS NULL) as null_co2,
+            COUNT(*) FILTER (WHERE avg_mph IS NULL) as null_mph,
+            COUNT(*) FILTER (WHERE hour_of_day IS NULL) as null_hour,
+            COUNT(*) FILTER (WHERE day_of_week IS NULL) as null_dow,
+            COUNT(*) FILTER (WHERE week_of_year IS NULL) as null_week,
+            COUNT(*) FILTER (WHERE month_of_year IS NULL) as null_month,
             AVG(trip_co2_kgs) as avg_co2,
             AVG(avg_mph) as avg_speed,
             MIN(hour_of_day) as min_hour,
@@ -222,8 +189,17 @@ def verify_transformations(con):
             MAX(week_of_year) as max_week,
             MIN(month_of_year) as min_month,
             MAX(month_of_year) as max_month
-        FROM green_trips
+        FROM green_trips_enriched
     """).fetchone()
+    null_co2_g, null_mph_g, null_hour_g, null_dow_g, null_week_g, null_month_g = row_g[:6]
+    stats_g = row_g[6:]
+    
+    print(f"Trips with NULL trip_co2_kgs: {null_co2_g}")
+    print(f"Trips with NULL avg_mph: {null_mph_g}")
+    print(f"Trips with NULL hour_of_day: {null_hour_g}")
+    print(f"Trips with NULL day_of_week: {null_dow_g}")
+    print(f"Trips with NULL week_of_year: {null_week_g}")
+    print(f"Trips with NULL month_of_year: {null_month_g}")
     
     print(f"Average CO2 per trip: {stats_g[0]:.3f} kg")
     print(f"Average speed: {stats_g[1]:.1f} mph")
@@ -232,8 +208,9 @@ def verify_transformations(con):
     print(f"Week range: {stats_g[6]} to {stats_g[7]}")
     print(f"Month range: {stats_g[8]} to {stats_g[9]}")
     
-    logger.info(f"Green trips - NULL counts: CO2={null_co2_g}, MPH={null_mph_g}, Hour={null_hour_g}, DOW={null_dow_g}, Week={null_week_g}, Month={null_month_g}")
-    logger.info(f"Green trips - Avg CO2: {stats_g[0]:.3f}, Avg Speed: {stats_g[1]:.1f}")
+    logger.info("Green trips - NULL counts: CO2=%d, MPH=%d, Hour=%d, DOW=%d, Week=%d, Month=%d",
+                null_co2_g, null_mph_g, null_hour_g, null_dow_g, null_week_g, null_month_g)
+    logger.info("Green trips - Avg CO2: %.3f, Avg Speed: %.1f", stats_g[0], stats_g[1])
     
     # Check if transformations were successful
     total_nulls = null_co2 + null_mph + null_hour + null_dow + null_week + null_month + null_co2_g + null_mph_g + null_hour_g + null_dow_g + null_week_g + null_month_g
@@ -259,15 +236,30 @@ def transform_data():
         # Configure DuckDB settings for large dataset processing
         print("Configuring DuckDB settings for large dataset...")
         con.execute("SET memory_limit='12GB'")  # Increase memory limit significantly
-        con.execute("SET threads=1")  # Use single thread to minimize memory usage
-        con.execute("SET preserve_insertion_order=false")  # Disable order preservation for efficiency
+        con.execute(f"SET threads={os.cpu_count()}")  # Use all cores; larger-than-memory work spills to temp_directory
+        con.execute("SET preserve_insertion_order=false")  # Disable order preservation so scans/updates run in parallel
+        con.execute("PRAGMA enable_object_cache")  # Cache table metadata across the many statements below
         con.execute("PRAGMA max_temp_directory_size='100GB'")  # Allow much more temp space
         con.execute("SET temp_directory='/tmp'")  # Use system temp directory
         logger.info("DuckDB settings configured for large dataset processing")
         
-        # Transform both taxi types
-        transform_yellow_trips(con)
-        transform_green_trips(con)
+        # Build the calendar lookup, then transform both taxi types
+        create_dim_date(con)
+        
+        # The two colors touch disjoint tables, so transform them concurrently, each on its
+        # own cursor; DuckDB's thread pool is shared between them rather than oversubscribed
+        cursors = [con.cursor(), con.cursor()]
+        try:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                futures = [
+                    executor.submit(transform_yellow_trips, cursors[0]),
+                    executor.submit(transform_green_trips, cursors[1]),
+                ]
+                for future in futures:
+                    future.result()  # Re-raises any transformation failure here
+        finally:
+            for cursor in cursors:
+                cursor.close()
         
         # Verify transformations were successful
         verify_transformations(con)
@@ -277,7 +269,7 @@ def transform_data():
         
     except Exception as e:
         print(f"Error during transformation: {e}")
-        logger.error(f"Error during transformation: {e}")
+        logger.error("Error during transformation: %s", e)
         raise
     finally:
         if con: